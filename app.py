@@ -27,8 +27,11 @@ def do_search():
     if not query:
         return jsonify({"results": [], "time": 0, "count": 0})
     
+    # ?debug=1 adds the query plan (strategy, term costs, early stops) to the response
+    debug = request.args.get('debug', '') == '1'
+
     # Run the search engine logic
-    data = search(query, doc_map)
+    data = search(query, doc_map, debug)
     
     # if search() returns None, send empty data to prevent a crash
     if not data:
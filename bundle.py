@@ -0,0 +1,391 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import glob
+import struct
+from array import array
+from bisect import bisect_left
+from docstore import DocStore
+
+# CONFIGURATION
+DOC_MAP_FILE = 'doc_urls.json'
+SPLIT_INDEX_DIR = 'split_indexes'
+VOCAB_DIR = 'split_vocabs'
+STATS_FILE = 'stats_index.json'
+DOC_LENGTH_FILE = 'doc_lengths.json'
+DOC_CHAMPION_LISTS_FILE = 'doc_champion_lists.json'
+DOC_ND_FILE = 'doc_near_duplicates.json'
+DOC_STORE_FILE = 'doc_store.bin'
+BUNDLE_FILE = 'index.bundle' # Name of the packed index file search.py maps at startup
+BUNDLE_MAGIC = b'M123IDX\0' # First bytes of every bundle file
+BUNDLE_VERSION = 2 # Bump whenever the section layout changes
+SECTION_ALIGNMENT = 64 # Every section starts on a multiple of this many bytes
+
+# Header at the start of the file: magic, version, manifest crc32, manifest offset, manifest length
+HEADER = struct.Struct('<8sIIQQ')
+
+# Sections are stored as native arrays so they can be used straight from the memory map
+ID_TYPE = 'I' # Doc IDs (4 bytes)
+OFFSET_TYPE = 'Q' # Offsets into other sections (8 bytes)
+WEIGHT_TYPE = 'd' # Weights, idfs and lengths (8 byte floats, same as the JSON values)
+
+class BundleError(ValueError):
+    """
+    Raised when index artifacts are missing, corrupt or don't belong together
+    """
+
+def pack_strings(strings):
+    """
+    Packs a list of strings into an offsets array (one extra end offset) and a UTF-8 blob
+    """
+    offsets = array(OFFSET_TYPE, [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, blob
+
+def load_vocabs():
+    """
+    Loads every split vocab into one dict of term -> (split char, byte position, df, idf)
+    """
+    vocab = {}
+    for file in sorted(glob.glob(os.path.join(VOCAB_DIR, "vocab_*.json"))):
+        # "vocab_m.json" -> "m"
+        char = os.path.basename(file).split('.')[0][len("vocab_"):]
+        with open(file, 'r', encoding='utf-8') as vocab_file:
+            for term, (position, df, idf) in json.load(vocab_file).items():
+                vocab[term] = (char, position, df, idf)
+    return vocab
+
+def compile_bundle(path=BUNDLE_FILE):
+    """
+    Packs the doc map, doc lengths, champion lists, near duplicates,
+    stats, vocabs, split indexes and document store into a single
+    bundle file. The artifacts are checked against each other first,
+    so a bundle is never built from files of different indexing runs.
+
+    Layout: header, aligned sections, then a JSON manifest with
+    every section's offset, length and crc32
+    """
+    print("\n--- COMPILING INDEX BUNDLE ---")
+
+    # Load all the index artifacts
+    try:
+        with open(STATS_FILE, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+        with open(DOC_MAP_FILE, 'r', encoding='utf-8') as f:
+            doc_map = json.load(f)
+        with open(DOC_LENGTH_FILE, 'r', encoding='utf-8') as f:
+            d_lengths = json.load(f)
+        with open(DOC_CHAMPION_LISTS_FILE, 'r', encoding='utf-8') as f:
+            champion_dict = json.load(f)
+        with open(DOC_ND_FILE, 'r', encoding='utf-8') as f:
+            doc_nd = json.load(f)
+    except FileNotFoundError as e:
+        raise BundleError(f"{e.filename} missing. Run indexer.py first.")
+
+    vocab = load_vocabs()
+
+    # CHECK THE ARTIFACTS MATCH
+    doc_count = stats["Document Count"]
+    if len(doc_map) != doc_count:
+        raise BundleError(f"{DOC_MAP_FILE} has {len(doc_map)} documents but {STATS_FILE} says {doc_count}")
+    if any(int(d_id) >= doc_count for d_id in d_lengths):
+        raise BundleError(f"{DOC_LENGTH_FILE} has documents that are not in {DOC_MAP_FILE}")
+    if champion_dict.keys() != vocab.keys():
+        raise BundleError(f"{DOC_CHAMPION_LISTS_FILE} terms don't match the vocabs in '{VOCAB_DIR}'")
+
+    # Doc vector lengths are needed first to normalize postings weights
+    doc_lengths = array(WEIGHT_TYPE, [0.0]) * doc_count # Docs without any tokens keep length 0
+    for d_id, length in d_lengths.items():
+        doc_lengths[int(d_id)] = length
+
+    # Terms are sorted by their UTF-8 bytes so the bundle can be binary searched
+    terms = sorted(vocab, key=lambda term: term.encode('utf-8'))
+    print(f"Packing {len(terms)} terms and {doc_count} documents...")
+
+    # TERM SECTIONS
+    term_offsets, term_blob = pack_strings(terms)
+    term_idf = array(WEIGHT_TYPE) # idf of each term
+    term_max_impact = array(WEIGHT_TYPE) # Highest normalized weight (tf-idf / doc length) in each term's postings
+    term_postings = array(OFFSET_TYPE, [0]) # Where each term's postings start (one extra end offset)
+    term_champions = array(OFFSET_TYPE, [0]) # Where each term's champion list starts (one extra end offset)
+    postings_ids = array(ID_TYPE)
+    postings_impacts = array(WEIGHT_TYPE) # tf-idf weight / doc length, so cosine scores need no length lookups
+    champion_ids = array(ID_TYPE)
+    champion_weights = array(WEIGHT_TYPE)
+
+    split_files = {} # Open split index files, one per split char
+    try:
+        for term in terms:
+            char, position, df, idf = vocab[term]
+
+            # Read the term's postings line from its split index
+            if char not in split_files:
+                split_files[char] = open(os.path.join(SPLIT_INDEX_DIR, f"{char}.json"), 'r', encoding='utf-8')
+            f = split_files[char]
+            f.seek(position)
+            posting = json.loads(f.readline()).get(term)
+            if posting is None or len(posting) != df:
+                raise BundleError(f"Split index '{char}.json' doesn't match vocab for term '{term}'")
+
+            max_impact = 0.0
+            for d_id, weight in posting.items():
+                d_id = int(d_id)
+                if d_id >= doc_count:
+                    raise BundleError(f"Split indexes have documents that are not in {DOC_MAP_FILE}")
+                length = doc_lengths[d_id]
+                impact = weight / length if length else 0.0
+                postings_ids.append(d_id)
+                postings_impacts.append(impact)
+                max_impact = max(max_impact, impact)
+            term_postings.append(len(postings_ids))
+            term_idf.append(idf)
+            term_max_impact.append(max_impact)
+
+            for weight, d_id in champion_dict[term]:
+                champion_ids.append(int(d_id))
+                champion_weights.append(weight)
+            term_champions.append(len(champion_ids))
+    except FileNotFoundError as e:
+        raise BundleError(f"{e.filename} missing. Run indexer.py first.")
+    finally:
+        for f in split_files.values():
+            f.close()
+
+    # DOCUMENT SECTIONS
+    url_offsets, url_blob = pack_strings(doc_map[str(d_id)] for d_id in range(doc_count))
+
+    nd_offsets = array(OFFSET_TYPE, [0]) # Where each doc's near duplicates start (one extra end offset)
+    nd_ids = array(ID_TYPE)
+    for d_id in range(doc_count):
+        nd_ids.extend(doc_nd.get(str(d_id), []))
+        nd_offsets.append(len(nd_ids))
+
+    sections = [
+        ("term_offsets", term_offsets),
+        ("term_blob", term_blob),
+        ("term_idf", term_idf),
+        ("term_max_impact", term_max_impact),
+        ("term_postings", term_postings),
+        ("term_champions", term_champions),
+        ("postings_ids", postings_ids),
+        ("postings_impacts", postings_impacts),
+        ("champion_ids", champion_ids),
+        ("champion_weights", champion_weights),
+        ("doc_lengths", doc_lengths),
+        ("url_offsets", url_offsets),
+        ("url_blob", url_blob),
+        ("nd_offsets", nd_offsets),
+        ("nd_ids", nd_ids),
+    ]
+
+    # The document store is optional (indexes built before it existed have none)
+    if os.path.exists(DOC_STORE_FILE):
+        with open(DOC_STORE_FILE, 'rb') as f:
+            sections.append(("doc_store", f.read()))
+        if DocStore(sections[-1][1]).doc_count != doc_count:
+            raise BundleError(f"{DOC_STORE_FILE} doesn't match {DOC_MAP_FILE}")
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "byteorder": sys.byteorder,
+        "types": {"id": ID_TYPE, "offset": OFFSET_TYPE, "weight": WEIGHT_TYPE},
+        "doc_count": doc_count,
+        "term_count": len(terms),
+        "stats": stats,
+        "sections": {},
+    }
+
+    # WRITE THE BUNDLE
+    # Write to a temporary file first so a crash never leaves a half-written bundle behind
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(bytes(HEADER.size)) # Placeholder, the header is written last
+
+        for name, data in sections:
+            f.write(bytes(-f.tell() % SECTION_ALIGNMENT)) # Pad up to the next aligned offset
+            manifest["sections"][name] = {
+                "offset": f.tell(),
+                "length": memoryview(data).nbytes,
+                "crc32": zlib.crc32(data),
+            }
+            f.write(data)
+
+        manifest_bytes = json.dumps(manifest).encode('utf-8')
+        manifest_offset = f.tell()
+        f.write(manifest_bytes)
+
+        f.seek(0)
+        f.write(HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, zlib.crc32(manifest_bytes), manifest_offset, len(manifest_bytes)))
+    os.replace(temp_path, path)
+
+    print(f"Saved bundle to '{path}' ({os.path.getsize(path)} bytes)" +
+        f"\n--- BUNDLE COMPLETE ---")
+
+class DocUrls:
+    """
+    Doc ID -> URL lookups straight from the bundle, used in place of the doc map dict
+    """
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, doc_id, default=None):
+        doc_id = int(doc_id)
+        if doc_id < 0 or doc_id >= len(self):
+            return default
+        return str(self.blob[self.offsets[doc_id]:self.offsets[doc_id + 1]], 'utf-8')
+
+class TermKeys:
+    """
+    Sorted view of the bundle's terms (as bytes) for binary searching
+    """
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+class IndexBundle:
+    """
+    Memory-maps a compiled bundle and gives access to its sections without
+    parsing them. Only the header and the small JSON manifest are read at
+    startup, along with layout checks that reject truncated, mismatched or
+    outdated bundles. Pass verify=True to also check every section's crc32
+    (this reads the whole file, so it isn't done by default)
+    """
+    def __init__(self, path=BUNDLE_FILE, verify=False):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+
+        # CHECK HEADER AND MANIFEST
+        if len(view) < HEADER.size:
+            raise BundleError(f"{path} is truncated")
+        magic, version, manifest_crc, manifest_offset, manifest_length = HEADER.unpack_from(view)
+        if magic != BUNDLE_MAGIC:
+            raise BundleError(f"{path} is not an index bundle")
+        if version != BUNDLE_VERSION:
+            raise BundleError(f"{path} is bundle version {version}, expected {BUNDLE_VERSION}. Run bundle.py again.")
+
+        manifest_bytes = view[manifest_offset:manifest_offset + manifest_length]
+        if len(manifest_bytes) != manifest_length or zlib.crc32(manifest_bytes) != manifest_crc:
+            raise BundleError(f"{path} manifest is corrupt")
+        manifest = json.loads(manifest_bytes.tobytes())
+
+        if manifest["byteorder"] != sys.byteorder:
+            raise BundleError(f"{path} was built on a {manifest['byteorder']} endian machine")
+        if manifest["types"] != {"id": ID_TYPE, "offset": OFFSET_TYPE, "weight": WEIGHT_TYPE}:
+            raise BundleError(f"{path} uses different array types")
+
+        self.manifest = manifest
+        self.stats = manifest["stats"]
+        self.doc_count = manifest["doc_count"]
+        self.term_count = manifest["term_count"]
+
+        # MAP SECTIONS
+        sections = {}
+        for name, info in manifest["sections"].items():
+            start, length = info["offset"], info["length"]
+            if start % SECTION_ALIGNMENT or start + length > manifest_offset:
+                raise BundleError(f"{path} section '{name}' is out of bounds")
+            sections[name] = view[start:start + length]
+            if verify and zlib.crc32(sections[name]) != info["crc32"]:
+                raise BundleError(f"{path} section '{name}' is corrupt")
+
+        def section(name, type_code, count=None):
+            if name not in sections:
+                raise BundleError(f"{path} is missing section '{name}'")
+            data = sections[name]
+            if type_code:
+                if len(data) % array(type_code).itemsize:
+                    raise BundleError(f"{path} section '{name}' ends partway through an item")
+                data = data.cast(type_code)
+            if count is not None and len(data) != count:
+                raise BundleError(f"{path} section '{name}' has {len(data)} items, expected {count}")
+            return data
+
+        self.term_offsets = section("term_offsets", OFFSET_TYPE, self.term_count + 1)
+        self.term_blob = section("term_blob", None)
+        self.term_idf = section("term_idf", WEIGHT_TYPE, self.term_count)
+        self.term_max_impact = section("term_max_impact", WEIGHT_TYPE, self.term_count)
+        self.term_postings = section("term_postings", OFFSET_TYPE, self.term_count + 1)
+        self.term_champions = section("term_champions", OFFSET_TYPE, self.term_count + 1)
+        self.postings_ids = section("postings_ids", ID_TYPE, self.term_postings[-1])
+        self.postings_impacts = section("postings_impacts", WEIGHT_TYPE, self.term_postings[-1])
+        self.champion_ids = section("champion_ids", ID_TYPE, self.term_champions[-1])
+        self.champion_weights = section("champion_weights", WEIGHT_TYPE, self.term_champions[-1])
+        self.doc_lengths = section("doc_lengths", WEIGHT_TYPE, self.doc_count)
+        self.nd_offsets = section("nd_offsets", OFFSET_TYPE, self.doc_count + 1)
+        self.nd_ids = section("nd_ids", ID_TYPE, self.nd_offsets[-1])
+        self.doc_urls = DocUrls(section("url_offsets", OFFSET_TYPE, self.doc_count + 1), section("url_blob", None))
+        self.terms = TermKeys(self.term_offsets, self.term_blob)
+
+        self.doc_store = None
+        if "doc_store" in sections:
+            self.doc_store = DocStore(sections["doc_store"])
+            if self.doc_store.doc_count != self.doc_count:
+                raise BundleError(f"{path} document store doesn't match the doc map")
+
+    def find_term(self, term):
+        """
+        Returns the term's ID, or -1 if the term is not in the index
+        """
+        key = term.encode('utf-8')
+        i = bisect_left(self.terms, key)
+        if i < self.term_count and self.terms[i] == key:
+            return i
+        return -1
+
+    def df(self, term_id):
+        """
+        Returns the number of documents that contain the term
+        """
+        return self.term_postings[term_id + 1] - self.term_postings[term_id]
+
+    def postings_size(self, term_id):
+        """
+        Returns the size of the term's postings in bytes
+        """
+        return self.df(term_id) * (self.postings_ids.itemsize + self.postings_impacts.itemsize)
+
+    def postings(self, term_id):
+        """
+        Returns the term's doc IDs (ascending) and normalized weights
+        (tf-idf / doc length) as two parallel arrays
+        """
+        start, end = self.term_postings[term_id], self.term_postings[term_id + 1]
+        return self.postings_ids[start:end], self.postings_impacts[start:end]
+
+    def champions(self, term_id):
+        """
+        Returns the term's champion list as (weight, doc ID) pairs, highest weight first
+        """
+        start, end = self.term_champions[term_id], self.term_champions[term_id + 1]
+        return list(zip(self.champion_weights[start:end], self.champion_ids[start:end]))
+
+    def near_duplicates(self, doc_id):
+        """
+        Returns the doc IDs of a document's near duplicates
+        """
+        return self.nd_ids[self.nd_offsets[doc_id]:self.nd_offsets[doc_id + 1]]
+
+if __name__ == "__main__":
+    # python bundle.py          -> compile the bundle from the indexer's output
+    # python bundle.py verify   -> check every section checksum of an existing bundle
+    if len(sys.argv) > 1 and sys.argv[1] == "verify":
+        bundle = IndexBundle(BUNDLE_FILE, verify=True)
+        print(f"{BUNDLE_FILE} OK: {bundle.term_count} terms, {bundle.doc_count} documents")
+    else:
+        compile_bundle()
@@ -0,0 +1,79 @@
+import os
+import json
+import math
+import random
+import pytest
+import bundle as bundle_module
+from bundle import IndexBundle, compile_bundle
+
+DOC_COUNT = 300
+WORDS = [f"{char}{i}" for char in "abcdefgh" for i in range(6)] # Split across several split indexes
+
+def write_index(docs):
+    """
+    Writes the indexer's artifacts for a list of {term: tf} documents into the current directory
+    """
+    postings = dict()
+    for d_id, doc in enumerate(docs):
+        for term, tf in doc.items():
+            postings.setdefault(term, dict())[str(d_id)] = tf
+
+    os.makedirs(bundle_module.SPLIT_INDEX_DIR)
+    os.makedirs(bundle_module.VOCAB_DIR)
+
+    squared = dict()
+    champions = dict()
+    for char in sorted({term[0] for term in postings}):
+        vocab = dict()
+        with open(os.path.join(bundle_module.SPLIT_INDEX_DIR, f"{char}.json"), 'w', encoding='utf-8') as f:
+            for term in sorted(term for term in postings if term[0] == char):
+                posting = postings[term]
+                idf = math.log(len(docs) / len(posting), 10)
+                vocab[term] = [f.tell(), len(posting), idf]
+                for id, tf in posting.items():
+                    posting[id] = (1 + math.log(tf, 10)) * idf
+                    squared[id] = squared.get(id, 0.0) + posting[id]**2
+                champions[term] = sorted(((weight, id) for id, weight in posting.items()), reverse=True)[:10]
+                json.dump({term: posting}, f)
+                f.write("\n")
+        with open(os.path.join(bundle_module.VOCAB_DIR, f"vocab_{char}.json"), 'w', encoding='utf-8') as f:
+            json.dump(vocab, f)
+
+    files = {
+        bundle_module.STATS_FILE: {"Document Count": len(docs)},
+        bundle_module.DOC_MAP_FILE: {str(d_id): f"https://example.com/{d_id}" for d_id in range(len(docs))},
+        bundle_module.DOC_LENGTH_FILE: {id: math.sqrt(total) for id, total in squared.items()},
+        bundle_module.DOC_CHAMPION_LISTS_FILE: champions,
+        bundle_module.DOC_ND_FILE: {"0": [1, 2], "1": [0], "2": [0]},
+    }
+    for name, data in files.items():
+        with open(name, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    return postings, files[bundle_module.DOC_LENGTH_FILE]
+
+@pytest.fixture
+def index_files(tmp_path, monkeypatch):
+    """
+    Writes the artifacts of a small index with a Zipf-like term distribution
+    (so some terms are in most documents) into a temporary working directory.
+    Returns the weighted postings and doc lengths
+    """
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(7)
+    docs = []
+    for _ in range(DOC_COUNT):
+        doc = dict()
+        for _ in range(rng.randint(1, 30)):
+            term = WORDS[min(int(rng.paretovariate(0.8)) - 1, len(WORDS) - 1)]
+            doc[term] = doc.get(term, 0) + 1
+        docs.append(doc)
+    return write_index(docs)
+
+@pytest.fixture
+def index(index_files):
+    """
+    Compiles the small index into a bundle. Returns the bundle, postings and doc lengths
+    """
+    postings, d_lengths = index_files
+    compile_bundle()
+    return IndexBundle(verify=True), postings, d_lengths
@@ -0,0 +1,107 @@
+import json
+import mmap
+import struct
+import zlib
+from functools import lru_cache
+
+# CONFIGURATION
+DOCS_PER_BLOCK = 4 # How many documents are compressed together in one block (a lookup decompresses the whole block)
+STORED_TEXT_CHARS = 20000 # Only the start of each document's text is stored, snippets never look further
+COMPRESSION_LEVEL = 6 # zlib compression level for each block
+BLOCK_CACHE_SIZE = 64 # How many decompressed blocks the reader keeps in memory
+STORE_MAGIC = b'M123DOCS' # Marks the end of a valid document store file
+
+# Trailer at the very end of the file: magic, docs per block, doc count, offset table position
+TRAILER = struct.Struct('<8sIQQ')
+
+class DocStoreWriter:
+    """
+    Writes documents (title and cleaned text) to a block-compressed store.
+    Documents must be added in doc ID order, and only the first
+    STORED_TEXT_CHARS characters of each text are kept. Every DOCS_PER_BLOCK
+    documents are compressed together, and a table with the byte offset of
+    every block is written at the end of the file so any doc ID can be found
+    with one seek
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.block = [] # Documents waiting to be compressed
+        self.offsets = [] # Byte offset of every block written so far
+        self.doc_count = 0
+
+    def add(self, title, text):
+        self.block.append([title, text[:STORED_TEXT_CHARS]])
+        self.doc_count += 1
+
+        # Compress the block once it is full
+        if len(self.block) == DOCS_PER_BLOCK:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self.block:
+            return
+        self.offsets.append(self.file.tell()) # Remember where this block starts
+        data = json.dumps(self.block).encode('utf-8')
+        self.file.write(zlib.compress(data, COMPRESSION_LEVEL))
+        self.block = []
+
+    def close(self):
+        # Write the last partial block
+        self._flush_block()
+
+        # The table position doubles as the end of the last block
+        table_position = self.file.tell()
+        self.offsets.append(table_position)
+
+        # Write block offset table and trailer
+        self.file.write(struct.pack(f'<{len(self.offsets)}Q', *self.offsets))
+        self.file.write(TRAILER.pack(STORE_MAGIC, DOCS_PER_BLOCK, self.doc_count, table_position))
+        self.file.close()
+
+class DocStore:
+    """
+    Random access reader for a document store written by DocStoreWriter.
+    Works on any buffer (bytes, mmap or memoryview), so the store
+    can be memory-mapped instead of read into memory
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+        # Read the trailer from the end of the buffer
+        if len(buffer) < TRAILER.size:
+            raise ValueError("Document store is truncated")
+        magic, self.docs_per_block, self.doc_count, table_position = TRAILER.unpack_from(buffer, len(buffer) - TRAILER.size)
+        if magic != STORE_MAGIC:
+            raise ValueError("Not a document store (bad magic)")
+
+        # Load the block offset table (one entry per block plus the end sentinel)
+        block_count = -(-self.doc_count // self.docs_per_block)
+        if table_position + (block_count + 1) * 8 + TRAILER.size > len(buffer):
+            raise ValueError("Document store offset table is truncated")
+        self.offsets = struct.unpack_from(f'<{block_count + 1}Q', buffer, table_position)
+
+        # Cache recently decompressed blocks, neighbouring doc IDs share a block
+        self._read_block = lru_cache(maxsize=BLOCK_CACHE_SIZE)(self._read_block)
+
+    def _read_block(self, block_id):
+        start, end = self.offsets[block_id], self.offsets[block_id + 1]
+        return json.loads(zlib.decompress(self.buffer[start:end]))
+
+    def get(self, doc_id):
+        """
+        Returns the (title, text) pair for a doc ID, or None if it is not in the store
+        """
+        doc_id = int(doc_id)
+        if doc_id < 0 or doc_id >= self.doc_count:
+            return None
+        block = self._read_block(doc_id // self.docs_per_block)
+        title, text = block[doc_id % self.docs_per_block]
+        return title, text
+
+def open_doc_store(path):
+    """
+    Memory-maps a document store file and returns a reader for it
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return DocStore(buffer)
@@ -6,7 +6,11 @@ import glob
 import math
 import heapq
 import mmh3
+from array import array
 from collections import Counter
+import multiprocessing
+from docstore import DocStoreWriter
+from bundle import compile_bundle
 
 # This simply ignores the warning about parsing XML documents
 # "XMLParsedAsHTMLWarning: It looks like you're using an HTML parser to parse an XML document."
@@ -25,7 +29,13 @@ STATS_FILE = 'stats_index.json' # Name of stats file
 DOC_CHAMPION_LISTS_FILE = 'doc_champion_lists.json' # Name of champions lists file
 DOC_LENGTH_FILE = 'doc_lengths.json' # Name of document vector length file
 DOC_ND_FILE = 'doc_near_duplicates.json' # Name of document near duplicates file
+DOC_STORE_FILE = 'doc_store.bin' # Name of compressed document store file (titles and text for snippets)
 HASH_SEED = 555 # Hash seed for consistent results
+MERGE_WORKERS = os.cpu_count() or 1 # Number of processes used to weight split indexes during merge (1 runs them in this process)
+
+# Split indexes and doc count the merge workers read from, set by initMergeWorker
+# (a serial merge also puts the doc vector lengths here, so they are added up directly)
+merge_data = dict()
 
 def build_inverted_index():
     #Create the output folder if it doesn't exist
@@ -46,6 +56,7 @@ def build_inverted_index():
     doc_unique_hashes = set() # set for storing doc hashes and detecting duplicates
     buckets = {f"bucket{i}": {} for i in range (1, 5)} # dict of buckets to calculate near duplicates
     doc_nd = dict() # dict for map of doc ids and near duplicates list
+    doc_store = DocStoreWriter(DOC_STORE_FILE) # Compressed store of doc titles and text
     
     print(f"--- STARTING INDEXING from '{DEV_DIR}' ---") 
 
@@ -72,9 +83,6 @@ def build_inverted_index():
                     # Add hash to unique hashes
                     doc_unique_hashes.add(doc_hash)
                     
-                    # Map the Document ID
-                    doc_map[doc_id] = url
-                    
                     # Parse HTML using bs
                     soup = bs(content, 'lxml')
                     text = soup.get_text()
@@ -115,6 +123,17 @@ def build_inverted_index():
                     doc_fingerprints[doc_id] = fingerprint # Update fingerprint dict
 
                     calculateNearDuplicates(fingerprint, doc_id, buckets, doc_nd, doc_fingerprints)
+
+                    # Save title and cleaned text once so search can show snippets without re-parsing HTML
+                    # Scripts and styles aren't readable text, so they are left out of snippets
+                    title = ' '.join(soup.title.get_text().split()) if soup.title else ''
+                    for node in soup.find_all(['script', 'style', 'noscript']):
+                        node.decompose()
+                    doc_store.add(title, ' '.join(soup.get_text().split()))
+
+                    # Map the Document ID (only once the document is fully processed, so a
+                    # failed document never leaves an extra entry behind)
+                    doc_map[doc_id] = url
                     
                     doc_id += 1 # Increment docs processed
 
@@ -137,6 +156,9 @@ def build_inverted_index():
     if inverted_index:
         total_index_size += dump_partial_index(inverted_index, partial_index_count)
     
+    # Finish writing the document store
+    doc_store.close()
+
     # Save the Document Map (ID -> URL)
     with open("doc_urls.json", "w") as f:
         json.dump(doc_map, f)
@@ -304,7 +326,8 @@ def mergeIndexes():
     valid_chars = set(string.ascii_lowercase + string.digits)
     
     # Initialize empty dictionaries for each letter/number, plus '_' for symbols
-    split_data = {char: {} for char in valid_chars}
+    # Sorted so files are written in the same order on every run
+    split_data = {char: {} for char in sorted(valid_chars)}
     split_data['_'] = {} 
 
     # Distribute every term into its corresponding bucket based on its first letter
@@ -320,7 +343,7 @@ def mergeIndexes():
             split_data['_'][term] = postings
 
     # Initialize empty bookmarking dictionaries for each split index
-    vocab_dict = {char: {} for char in valid_chars}
+    vocab_dict = {char: {} for char in sorted(valid_chars)}
     vocab_dict['_'] = {}
 
     # Get total number of docs for idf calculation
@@ -328,47 +351,29 @@ def mergeIndexes():
         stats = json.load(stats_) # Load stats as dict
         total_docs = stats["Document Count"] # Get total docs in index
 
-    # Counter for tracking document vector lengths
-    d_lengths = Counter()
+    # Squared document vector lengths, indexed by doc ID (a list is much faster to add to than a Counter)
+    d_lengths = [0.0] * total_docs
 
     # Dict to store top 10 tf-idf doc weights for each term (champion list)
     champion_dict = dict()
 
     # Save split indexes to disk
-    # Write each letter's dictionary to its own JSON file 
-    for char, data in split_data.items():
-        if data: # Only create the file if there are actually words in this bucket
-            file_path = os.path.join(FINAL_INDEX_DIR, f"{char}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for term, posting in sorted(data.items()):
-                    position = f.tell() # Get byte position
-                    heap = [] # Min heap to track top r documents (by tf-idf weight)
-
-                    # VOCAB CREATION
-                    df = len(posting) # Gets total number of documents that contain term
-                    idf = math.log((total_docs / df), 10) # Calculate idf
-                    term_stats = [position, df, idf] # List that holds term statistics
-                    vocab_dict[char][term] = term_stats # Add term and byte position, df, and idf to vocabulary
-
-                    # CALCULATE DOC VECTOR LENGTH
-                    for id, tf in posting.items():
-                        weight = (1 + math.log(tf, 10)) * idf # Calculate document weight
-                        posting[id] = weight # Update posting tf to tf-idf weight
-                        d_lengths[int(id)] += weight**2 # Add to sum of doc weight squared
-
-                        # CHAMPION LIST CREATION
-                        pair = (weight, id) # Make a pair for heap insertions
-                        if(len(heap) < 10): # r = 10
-                            heapq.heappush(heap, pair) # Push if less than 10
-                        else: # Push if greater than smallest heap weight
-                            if(weight > heap[0][0]): heapq.heapreplace(heap, pair)
-                    
-                    heap = sorted(heap, reverse=True) # Sort champion heap in descending order
-                    champion_dict[term] = heap # Add term champion heap to dict
-
-                    # SAVE POSTINGS LIST TO FILE
-                    json.dump({term:posting}, f) # Add term and updated postings list to split index file
-                    f.write("\n")
+    # Each letter's dictionary is weighted and written to its own JSON file, by worker processes if there are several
+    chars = [char for char, data in split_data.items() if data] # Only buckets with words in them
+
+    if MERGE_WORKERS > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        print(f"Weighting split indexes with {MERGE_WORKERS} workers...")
+        # Forked workers inherit the split indexes, so only bucket chars are sent to them
+        context = multiprocessing.get_context('fork')
+        with context.Pool(MERGE_WORKERS, initializer=initMergeWorker, initargs=(split_data, total_docs)) as pool:
+            # imap hands back results in bucket order, so output order matches a serial run
+            results = pool.imap(processSplitIndex, chars)
+            collectSplitIndexes(results, vocab_dict, champion_dict, d_lengths)
+    else:
+        # One worker (or no fork on this platform): no processes to start or results to copy back
+        print("Weighting split indexes...")
+        initMergeWorker(split_data, total_docs, d_lengths)
+        collectSplitIndexes(map(processSplitIndex, chars), vocab_dict, champion_dict, d_lengths)
 
     # Let user know vocabs are being saved
     print("Saving index vocabs to disk...")
@@ -391,8 +396,8 @@ def mergeIndexes():
     print("Calculating final document vector lengths...")
 
     # SQUARE ROOT ALL DOC VECTOR LENGTHS
-    for d_id, length in d_lengths.items():
-        d_lengths[d_id] = math.sqrt(length)
+    # Docs without any weight are left out, the bundle gives them length 0
+    d_lengths = {d_id: math.sqrt(length) for d_id, length in enumerate(d_lengths) if length}
     
     # Let user know final document vector lengths are being saved
     print("Saving final document vector lengths to disk...")
@@ -407,6 +412,85 @@ def mergeIndexes():
         f"Saved document vector lengths to '{DOC_LENGTH_FILE}' file" +
         f"\n--- MERGE COMPLETE ---")
 
+# Helper that gives the merge workers the split indexes
+def initMergeWorker(split_data, total_docs, d_lengths=None):
+    merge_data["split_data"] = split_data
+    merge_data["total_docs"] = total_docs
+    merge_data["d_lengths"] = d_lengths
+
+# Helper that adds the worker results for every bucket to the merged vocabs, champion lists and doc lengths
+def collectSplitIndexes(results, vocab_dict, champion_dict, d_lengths):
+    for char, vocab, champions, contribution_ids, contribution_squares in results:
+        vocab_dict[char] = vocab # Add bucket vocab
+        champion_dict.update(champions) # Add bucket champion lists
+
+        # Add partial doc vector lengths in the original order so the float sums are identical
+        for d_id, square in zip(contribution_ids, contribution_squares):
+            d_lengths[d_id] += square
+
+# Worker that weights and saves one split index bucket
+def processSplitIndex(char):
+    """
+    Writes one alphabetical split index to disk and calculates its
+    vocab (byte position, df, idf), champion lists, and each document's
+    squared weights. Runs in a worker process, so everything is returned.
+
+    Squared weights are returned in posting order (not summed) as flat
+    doc ID and weight arrays, so the parent can add them up exactly like
+    a serial merge would and they are cheap to send back. In a serial
+    merge they are added to the doc vector lengths right away instead.
+    """
+    data = merge_data["split_data"][char]
+    total_docs = merge_data["total_docs"]
+    d_lengths = merge_data["d_lengths"] # Only set when running in the merging process
+
+    vocab = dict() # Vocab for this split index
+    champions = dict() # Champion lists for the terms in this split index
+    contribution_ids = array('I') # Doc ID of each squared weight for doc vector lengths
+    contribution_squares = array('d') # Squared weights, in posting order
+
+    file_path = os.path.join(FINAL_INDEX_DIR, f"{char}.json")
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for term, posting in sorted(data.items()):
+            position = f.tell() # Get byte position
+            heap = [] # Min heap to track top r documents (by tf-idf weight)
+
+            # VOCAB CREATION
+            df = len(posting) # Gets total number of documents that contain term
+            idf = math.log((total_docs / df), 10) # Calculate idf
+            term_stats = [position, df, idf] # List that holds term statistics
+            vocab[term] = term_stats # Add term and byte position, df, and idf to vocabulary
+
+            # CALCULATE DOC VECTOR LENGTH
+            for id, tf in posting.items():
+                weight = (1 + math.log(tf, 10)) * idf # Calculate document weight
+                posting[id] = weight # Update posting tf to tf-idf weight
+
+                # Save squared weight for doc vector length
+                if d_lengths is not None:
+                    d_lengths[int(id)] += weight**2
+                else:
+                    contribution_ids.append(int(id))
+                    contribution_squares.append(weight**2)
+
+                # CHAMPION LIST CREATION
+                pair = (weight, id) # Make a pair for heap insertions
+                if(len(heap) < 10): # r = 10
+                    heapq.heappush(heap, pair) # Push if less than 10
+                else: # Push if greater than smallest heap weight
+                    if(weight > heap[0][0]): heapq.heapreplace(heap, pair)
+
+            heap = sorted(heap, reverse=True) # Sort champion heap in descending order
+            champions[term] = heap # Add term champion heap to dict
+
+            # SAVE POSTINGS LIST TO FILE
+            # json.dumps uses the C encoder (json.dump encodes in Python), the output is the same
+            f.write(json.dumps({term:posting})) # Add term and updated postings list to split index file
+            f.write("\n")
+
+    return char, vocab, champions, contribution_ids, contribution_squares
+
 if __name__ == "__main__":
     build_inverted_index()
-    mergeIndexes()
\ No newline at end of file
+    mergeIndexes()
+    compile_bundle() # Pack everything into the bundle search.py maps at startup
\ No newline at end of file
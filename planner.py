@@ -0,0 +1,229 @@
+import math
+import heapq
+from bisect import bisect_left
+from collections import Counter
+
+# CONFIGURATION
+TOP_K = 20 # Number of ranked documents a query produces (before near duplicate removal)
+COST_BUDGET_MS = 100 # Most estimated time an exact strategy may take before falling back to champion lists
+
+# Estimated microseconds per posting, measured on a 50k document index with 900 random queries.
+# "Walk" postings belong to terms scored before the early stop, "rest" postings to the terms after it
+TAAT_WALK_COST = 0.21
+TAAT_REST_COST = 0.035 # Only candidates are looked up (or the list is walked without adding new documents)
+CHAMPION_COST = 0.3 # Champion lists are scored like term-at-a-time, but can't stop early
+LOOKUP_COST = 0.5 # Cost of one binary search step compared to walking one posting
+THRESHOLD_CANDIDATES = 40 # Champion candidates scored exactly for the starting threshold
+THRESHOLD_MARGIN = 1e-9 # Champion and postings scores are summed in a different order, allow for rounding
+
+# Evaluation strategies the planner can choose from
+CHAMPION = "champion" # Score champion lists only (bounded cost, approximate)
+TAAT = "term-at-a-time" # Score whole postings lists one term after another, stopping early when possible
+
+def plan_query(bundle, tokens, k=TOP_K):
+    """
+    Looks up the query terms in the bundle and decides how to evaluate them.
+
+    Every term gets a query weight and an upper bound on how much it can add
+    to any document's score (query weight * the term's max impact), and the
+    terms are put in evaluation order, highest bound first. The best champion
+    list candidates are scored exactly with binary search lookups, and the
+    k-th best of those scores is a safe starting threshold: the true k-th
+    best score can't be lower. With that threshold the planner estimates the
+    time of exact term-at-a-time evaluation and uses it if it fits in
+    COST_BUDGET_MS, otherwise it stays with the champion lists
+    """
+    # Find valid query terms (tokens in the vocab) and their query tf
+    q_tf = Counter(tokens)
+
+    terms = []
+    for token, query_freq in q_tf.items():
+        term_id = bundle.find_term(token)
+        if term_id == -1: # Not in the vocab
+            continue
+        idf = bundle.term_idf[term_id]
+        weight = (1 + math.log(query_freq, 10)) * idf # Query term tf-idf weight
+        terms.append({
+            "term": token,
+            "id": term_id,
+            "df": bundle.df(term_id),
+            "idf": idf,
+            "postings_bytes": bundle.postings_size(term_id),
+            "max_impact": bundle.term_max_impact[term_id],
+            "weight": weight,
+            "bound": weight * bundle.term_max_impact[term_id], # Most this term can add to a document's score
+        })
+
+    # Terms that appear in every document have no weight and can't change any score
+    skipped = [term["term"] for term in terms if term["weight"] <= 0]
+    terms = [term for term in terms if term["weight"] > 0]
+
+    # Evaluation order: highest bound first, so the bound of the terms left shrinks as fast as possible
+    terms.sort(key=lambda term: term["bound"], reverse=True)
+
+    plan = {"k": k, "terms": terms, "skipped_terms": skipped}
+    if not terms:
+        plan["mode"] = None
+        return plan
+
+    # Query vector length for cosine normalization
+    plan["q_length"] = math.sqrt(sum(term["weight"]**2 for term in terms))
+
+    # STARTING THRESHOLD
+    # Exact scores of the best champion candidates, the k-th best can't be above the true k-th best score
+    plan["champion_scores"] = score_champions(bundle, terms)
+    candidates = heapq.nlargest(THRESHOLD_CANDIDATES, plan["champion_scores"], key=plan["champion_scores"].get)
+    top = heapq.nlargest(k, (exact_score(bundle, terms, d_id) for d_id in candidates))
+    threshold = top[-1] * (1 - THRESHOLD_MARGIN) if len(top) == k else 0.0
+    plan["threshold"] = threshold
+
+    # ESTIMATE COSTS (microseconds)
+    # Term-at-a-time stops walking postings once the bound of the terms left is below the threshold
+    # (the threshold only rises while it runs, so this is a safe estimate), the rest are only used for candidates
+    walked = 0
+    remaining_bound = sum(term["bound"] for term in terms)
+    for term in terms:
+        if remaining_bound < threshold:
+            break
+        remaining_bound -= term["bound"]
+        walked += term["df"]
+    rest = sum(term["df"] for term in terms) - walked
+
+    taat_cost = walked * TAAT_WALK_COST + rest * TAAT_REST_COST
+    plan["walked_postings"] = walked
+    plan["costs"] = {CHAMPION: round(champion_postings(bundle, terms) * CHAMPION_COST), TAAT: round(taat_cost)}
+
+    # CHOOSE STRATEGY
+    if taat_cost > COST_BUDGET_MS * 1000:
+        plan["mode"] = CHAMPION # Too expensive, keep latency bounded
+    else:
+        plan["mode"] = TAAT
+    return plan
+
+def run_plan(bundle, plan):
+    """
+    Evaluates a plan from plan_query and returns (cosine score, doc ID)
+    pairs for the top k documents, highest score first. Details about how
+    the query ran (postings scored, early stops) are added to the plan
+    """
+    if not plan["mode"]:
+        return []
+
+    if plan["mode"] == CHAMPION:
+        scores = plan["champion_scores"]
+        top = heapq.nlargest(plan["k"], scores.items(), key=lambda pair: pair[1])
+        plan["postings_scored"] = champion_postings(bundle, plan["terms"])
+    else:
+        top = term_at_a_time(bundle, plan)
+
+    # CALCULATE COSINE SIMILARITY SCORE (postings are already divided by doc length)
+    q_length = plan["q_length"]
+    results = [(score / q_length, d_id) for d_id, score in top]
+    return sorted(results, reverse=True)
+
+def champion_postings(bundle, terms):
+    """
+    Returns how many champion list entries the terms have together
+    """
+    return sum(bundle.term_champions[term["id"] + 1] - bundle.term_champions[term["id"]] for term in terms)
+
+def score_champions(bundle, terms):
+    """
+    Scores the documents in the terms' champion lists.
+    Returns doc ID -> dot product / doc length (not divided by query length yet)
+    """
+    # CALCULATE DOT PRODUCT for each document in the champion lists
+    dot_products = Counter()
+    for term in terms:
+        for d_weight, d_id in bundle.champions(term["id"]):
+            dot_products[d_id] += d_weight * term["weight"]
+
+    # Divide by doc length
+    scores = dict()
+    for d_id, dot in dot_products.items():
+        d_length = bundle.doc_lengths[d_id]
+        if d_length:
+            scores[d_id] = dot / d_length
+    return scores
+
+def lookup_impact(ids, impacts, d_id, start=0):
+    """
+    Binary searches a postings list for a doc. Returns (impact or 0, position)
+    """
+    position = bisect_left(ids, d_id, start)
+    if position < len(ids) and ids[position] == d_id:
+        return impacts[position], position
+    return 0.0, position
+
+def exact_score(bundle, terms, d_id):
+    """
+    Scores one document against every query term with binary search lookups
+    """
+    score = 0.0
+    for term in terms:
+        ids, impacts = bundle.postings(term["id"])
+        score += term["weight"] * lookup_impact(ids, impacts, d_id)[0]
+    return score
+
+def term_at_a_time(bundle, plan):
+    """
+    Adds up scores one postings list at a time in plan order (highest bound
+    first). Partial scores only grow, so the k-th best partial score raises
+    the threshold as it goes. Once the bound of the terms left is below the
+    threshold, no document that hasn't been seen yet can make the top k, so
+    the remaining lists are only binary searched for the accumulated
+    documents that can still reach the threshold
+    """
+    k = plan["k"]
+    terms = plan["terms"]
+    threshold = plan["threshold"]
+    accumulators = dict()
+    scored = 0
+
+    for i, term in enumerate(terms):
+        ids, impacts = bundle.postings(term["id"])
+        weight = term["weight"]
+        for d_id, impact in zip(ids, impacts):
+            accumulators[d_id] = accumulators.get(d_id, 0.0) + weight * impact
+        scored += len(ids)
+
+        remaining = terms[i + 1:]
+        if not remaining:
+            break
+
+        # Raise the threshold with the partial scores
+        top = heapq.nlargest(k, accumulators.values())
+        if len(top) == k:
+            threshold = max(threshold, top[-1] * (1 - THRESHOLD_MARGIN))
+
+        # EARLY STOP CHECK
+        remaining_bound = sum(term["bound"] for term in remaining)
+        if remaining_bound < threshold:
+            # Only documents that can still reach the threshold need the remaining terms
+            cutoff = threshold - remaining_bound
+            candidates = {d_id: score for d_id, score in accumulators.items() if score >= cutoff}
+            for rest in remaining:
+                rest_ids, rest_impacts = bundle.postings(rest["id"])
+                weight = rest["weight"]
+                lookups = len(candidates) * max(1, len(rest_ids).bit_length()) # Binary search steps
+                if lookups * LOOKUP_COST < len(rest_ids):
+                    # Few candidates: binary search each one
+                    for d_id in candidates:
+                        position = bisect_left(rest_ids, d_id)
+                        if position < len(rest_ids) and rest_ids[position] == d_id:
+                            candidates[d_id] += weight * rest_impacts[position]
+                    scored += len(candidates)
+                else:
+                    # Most documents are still candidates: walk the list, skipping everything else
+                    for d_id, impact in zip(rest_ids, rest_impacts):
+                        if d_id in candidates:
+                            candidates[d_id] += weight * impact
+                    scored += len(rest_ids)
+
+            plan["early_stop"] = {"after_term": term["term"], "terms_skipped": [rest["term"] for rest in remaining],
+                                  "candidates": len(candidates)}
+            plan["postings_scored"] = scored
+            return heapq.nlargest(k, candidates.items(), key=lambda pair: pair[1])
+
+    plan["postings_scored"] = scored
+    return heapq.nlargest(k, accumulators.items(), key=lambda pair: pair[1])
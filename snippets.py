@@ -0,0 +1,87 @@
+import re
+import html
+from functools import lru_cache
+from collections import Counter
+from tokenizer import stemmer
+from docstore import STORED_TEXT_CHARS
+
+# CONFIGURATION
+SNIPPET_SCAN_CHARS = STORED_TEXT_CHARS # Only look for query terms in the start of long documents
+SNIPPET_LENGTH = 240 # Number of characters shown in a snippet
+SNIPPET_LEAD = 40 # Characters of context shown before the first highlighted term
+
+# Words repeat a lot between documents, so remember their stems
+stem_word = lru_cache(maxsize=100000)(stemmer.stem)
+
+# Same word pattern the tokenizer uses
+WORD_PATTERN = re.compile(r'[a-zA-Z0-9]+')
+
+def make_snippet(text, query_terms):
+    """
+    Picks the part of a document's text with the most distinct query terms
+    and returns it as HTML with the matching words wrapped in <b> tags
+    """
+    text = text[:SNIPPET_SCAN_CHARS]
+
+    # Find every word that stems to a query term as (start, end, term)
+    matches = []
+    for match in WORD_PATTERN.finditer(text):
+        term = stem_word(match.group().lower())
+        if term in query_terms:
+            matches.append((match.start(), match.end(), term))
+
+    # Choose the window that covers the most distinct query terms (earliest wins ties)
+    # Sliding window over the matches: counts holds how often each term is in matches[i:next_match]
+    window_start = 0
+    if matches:
+        best_count = 0
+        counts = Counter()
+        next_match = 0
+        for i, (start, _, term) in enumerate(matches):
+            next_match = max(next_match, i) # A match longer than the window is never added
+
+            # Grow the window with every match that still fits after this one
+            limit = start + SNIPPET_LENGTH - SNIPPET_LEAD
+            while next_match < len(matches) and matches[next_match][1] <= limit:
+                counts[matches[next_match][2]] += 1
+                next_match += 1
+
+            if len(counts) > best_count:
+                best_count = len(counts)
+                window_start = max(0, start - SNIPPET_LEAD)
+
+            # Drop this match before the window moves to the next one
+            if next_match > i:
+                counts[term] -= 1
+                if not counts[term]:
+                    del counts[term]
+
+    window_end = min(len(text), window_start + SNIPPET_LENGTH)
+
+    # Don't cut words in half at the edges of the window
+    if window_start > 0:
+        space = text.find(' ', window_start)
+        if space != -1 and space < window_end:
+            window_start = space + 1
+    if window_end < len(text):
+        space = text.rfind(' ', window_start, window_end)
+        if space > window_start:
+            window_end = space
+
+    # Escape the text and highlight the query terms inside the window
+    pieces = []
+    position = window_start
+    for start, end, _ in matches:
+        if start < window_start or end > window_end:
+            continue
+        pieces.append(html.escape(text[position:start]))
+        pieces.append("<b>" + html.escape(text[start:end]) + "</b>")
+        position = end
+    pieces.append(html.escape(text[position:window_end]))
+
+    snippet = ''.join(pieces)
+    if window_start > 0:
+        snippet = "... " + snippet
+    if window_end < len(text):
+        snippet += " ..."
+    return snippet
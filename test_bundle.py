@@ -0,0 +1,190 @@
+import os
+import json
+import zlib
+import pytest
+import bundle as bundle_module
+from bundle import IndexBundle, BundleError, compile_bundle, HEADER, BUNDLE_MAGIC, BUNDLE_VERSION
+from docstore import DocStoreWriter
+from conftest import DOC_COUNT
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return HEADER.unpack(f.read(HEADER.size))
+
+def rewrite(path, position, data):
+    with open(path, 'r+b') as f:
+        f.seek(position)
+        f.write(data)
+
+def edit_manifest(path, edit):
+    """
+    Changes the manifest with edit(manifest) and writes it back with a matching checksum
+    """
+    magic, version, _, manifest_offset, manifest_length = read_header(path)
+    with open(path, 'rb') as f:
+        f.seek(manifest_offset)
+        manifest = json.loads(f.read(manifest_length))
+    edit(manifest)
+    manifest_bytes = json.dumps(manifest).encode('utf-8')
+    with open(path, 'r+b') as f:
+        f.seek(manifest_offset)
+        f.write(manifest_bytes)
+        f.truncate()
+    rewrite(path, 0, HEADER.pack(magic, version, zlib.crc32(manifest_bytes), manifest_offset, len(manifest_bytes)))
+
+def edit_json(name, edit):
+    with open(name, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    edit(data)
+    with open(name, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+def test_bundle_matches_artifacts(index):
+    bundle, postings, d_lengths = index
+    assert bundle.term_count == len(postings)
+    assert list(bundle.terms) == sorted(term.encode('utf-8') for term in postings)
+
+    for term, posting in postings.items():
+        term_id = bundle.find_term(term)
+        assert bundle.df(term_id) == len(posting)
+        ids, impacts = bundle.postings(term_id)
+        assert list(ids) == [int(id) for id in posting]
+        assert list(impacts) == pytest.approx([weight / d_lengths[id] for id, weight in posting.items()])
+        assert [d_id for _, d_id in bundle.champions(term_id)] == \
+            [int(id) for _, id in sorted(((weight, id) for id, weight in posting.items()), reverse=True)[:10]]
+    assert bundle.find_term("missing") == -1
+
+    assert bundle.doc_urls.get(5) == "https://example.com/5"
+    assert bundle.doc_urls.get(bundle.doc_count) is None
+    assert list(bundle.near_duplicates(0)) == [1, 2]
+    assert list(bundle.near_duplicates(3)) == []
+    assert bundle.doc_store is None
+
+def test_bundle_includes_doc_store(index_files):
+    writer = DocStoreWriter(bundle_module.DOC_STORE_FILE)
+    for d_id in range(DOC_COUNT):
+        writer.add(f"Title {d_id}", f"text {d_id}")
+    writer.close()
+    compile_bundle()
+    assert IndexBundle(verify=True).doc_store.get(7) == ("Title 7", "text 7")
+
+# BUNDLE FILE CHECKS
+
+def test_bundle_rejects_wrong_version(index):
+    header = read_header(bundle_module.BUNDLE_FILE)
+    rewrite(bundle_module.BUNDLE_FILE, 0, HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION + 1, *header[2:]))
+    with pytest.raises(BundleError, match="version"):
+        IndexBundle()
+
+def test_bundle_rejects_bad_magic(index):
+    rewrite(bundle_module.BUNDLE_FILE, 0, b'NOTINDEX')
+    with pytest.raises(BundleError, match="not an index bundle"):
+        IndexBundle()
+
+def test_bundle_rejects_truncated_file(index):
+    with open(bundle_module.BUNDLE_FILE, 'r+b') as f:
+        f.truncate(HEADER.size - 1)
+    with pytest.raises(BundleError, match="truncated"):
+        IndexBundle()
+
+def test_bundle_rejects_corrupt_manifest(index):
+    manifest_offset = read_header(bundle_module.BUNDLE_FILE)[3]
+    rewrite(bundle_module.BUNDLE_FILE, manifest_offset + 1, b'#')
+    with pytest.raises(BundleError, match="manifest is corrupt"):
+        IndexBundle()
+
+def test_bundle_rejects_out_of_bounds_section(index):
+    def edit(manifest):
+        manifest["sections"]["postings_ids"]["length"] += 10**9
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    with pytest.raises(BundleError, match="'postings_ids' is out of bounds"):
+        IndexBundle()
+
+def test_bundle_rejects_misaligned_section(index):
+    def edit(manifest):
+        manifest["sections"]["term_idf"]["offset"] += 1
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    with pytest.raises(BundleError, match="'term_idf' is out of bounds"):
+        IndexBundle()
+
+def test_bundle_rejects_wrong_item_count(index):
+    def edit(manifest):
+        manifest["sections"]["doc_lengths"]["length"] -= 8
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    with pytest.raises(BundleError, match="'doc_lengths' has"):
+        IndexBundle()
+
+def test_bundle_rejects_partial_item(index):
+    def edit(manifest):
+        manifest["sections"]["doc_lengths"]["length"] -= 1
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    with pytest.raises(BundleError, match="'doc_lengths' ends partway"):
+        IndexBundle()
+
+def test_bundle_rejects_missing_section(index):
+    def edit(manifest):
+        del manifest["sections"]["nd_ids"]
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    with pytest.raises(BundleError, match="missing section 'nd_ids'"):
+        IndexBundle()
+
+def test_verify_finds_corrupt_section(index):
+    def edit(manifest):
+        manifest["sections"]["term_blob"]["crc32"] ^= 1
+    edit_manifest(bundle_module.BUNDLE_FILE, edit)
+    IndexBundle() # Section checksums are only read with verify=True
+    with pytest.raises(BundleError, match="'term_blob' is corrupt"):
+        IndexBundle(verify=True)
+
+# ARTIFACT MISMATCH CHECKS
+
+def test_compile_rejects_missing_artifact(index_files):
+    os.remove(bundle_module.DOC_LENGTH_FILE)
+    with pytest.raises(BundleError, match="missing"):
+        compile_bundle()
+
+def test_compile_rejects_doc_count_mismatch(index_files):
+    edit_json(bundle_module.STATS_FILE, lambda stats: stats.update({"Document Count": stats["Document Count"] + 1}))
+    with pytest.raises(BundleError, match="documents but"):
+        compile_bundle()
+
+def test_compile_rejects_unknown_doc_length(index_files):
+    edit_json(bundle_module.DOC_LENGTH_FILE, lambda lengths: lengths.update({"100000": 1.0}))
+    with pytest.raises(BundleError, match=bundle_module.DOC_LENGTH_FILE):
+        compile_bundle()
+
+def test_compile_rejects_champions_vocab_mismatch(index_files):
+    edit_json(bundle_module.DOC_CHAMPION_LISTS_FILE, lambda champions: champions.pop("a0"))
+    with pytest.raises(BundleError, match="terms don't match the vocabs"):
+        compile_bundle()
+
+def test_compile_rejects_split_index_vocab_mismatch(index_files):
+    vocab_file = os.path.join(bundle_module.VOCAB_DIR, "vocab_a.json")
+    edit_json(vocab_file, lambda vocab: vocab["a0"].__setitem__(1, vocab["a0"][1] + 1)) # Wrong df
+    with pytest.raises(BundleError, match="doesn't match vocab for term 'a0'"):
+        compile_bundle()
+
+def test_compile_rejects_unknown_doc_in_postings(index_files):
+    # Drop the last document everywhere except the split indexes
+    last = str(DOC_COUNT - 1)
+    edit_json(bundle_module.STATS_FILE, lambda stats: stats.update({"Document Count": DOC_COUNT - 1}))
+    edit_json(bundle_module.DOC_MAP_FILE, lambda doc_map: doc_map.pop(last))
+    edit_json(bundle_module.DOC_LENGTH_FILE, lambda lengths: lengths.pop(last, None))
+    with pytest.raises(BundleError, match="Split indexes have documents"):
+        compile_bundle()
+
+def test_compile_rejects_doc_store_mismatch(index_files):
+    writer = DocStoreWriter(bundle_module.DOC_STORE_FILE)
+    writer.add("only", "one document")
+    writer.close()
+    with pytest.raises(BundleError, match=bundle_module.DOC_STORE_FILE):
+        compile_bundle()
+
+def test_failed_compile_keeps_old_bundle(index):
+    with open(bundle_module.BUNDLE_FILE, 'rb') as f:
+        before = f.read()
+    edit_json(bundle_module.DOC_CHAMPION_LISTS_FILE, lambda champions: champions.pop("a0"))
+    with pytest.raises(BundleError):
+        compile_bundle()
+    with open(bundle_module.BUNDLE_FILE, 'rb') as f:
+        assert f.read() == before
@@ -0,0 +1,58 @@
+import pytest
+import docstore
+from docstore import DocStoreWriter, DocStore, open_doc_store, DOCS_PER_BLOCK, STORED_TEXT_CHARS
+
+def write_store(path, docs):
+    writer = DocStoreWriter(path)
+    for title, text in docs:
+        writer.add(title, text)
+    writer.close()
+    return open_doc_store(path)
+
+def test_round_trip_with_partial_last_block(tmp_path):
+    # Two full blocks and one document in a third
+    docs = [(f"Title {i}", f"text of document {i} é ✓") for i in range(DOCS_PER_BLOCK * 2 + 1)]
+    store = write_store(tmp_path / "store.bin", docs)
+
+    assert store.doc_count == len(docs)
+    assert len(store.offsets) == 4 # Three blocks and the end sentinel
+    for d_id, doc in enumerate(docs):
+        assert store.get(d_id) == doc
+    assert store.get(str(len(docs) - 1)) == docs[-1] # Doc IDs from JSON keys are strings
+
+def test_out_of_range_ids(tmp_path):
+    store = write_store(tmp_path / "store.bin", [("a", "b"), ("c", "d")])
+    assert store.get(-1) is None
+    assert store.get(2) is None
+
+def test_empty_store(tmp_path):
+    store = write_store(tmp_path / "store.bin", [])
+    assert store.doc_count == 0
+    assert store.get(0) is None
+
+def test_text_is_truncated(tmp_path):
+    store = write_store(tmp_path / "store.bin", [("long", "x" * (STORED_TEXT_CHARS + 100))])
+    assert store.get(0) == ("long", "x" * STORED_TEXT_CHARS)
+
+def test_reads_stores_with_other_block_sizes(tmp_path, monkeypatch):
+    # The block size is read from the trailer, not the current configuration
+    monkeypatch.setattr(docstore, "DOCS_PER_BLOCK", 3)
+    docs = [("t", str(i)) for i in range(7)]
+    path = tmp_path / "store.bin"
+    write_store(path, docs)
+    monkeypatch.setattr(docstore, "DOCS_PER_BLOCK", 5)
+    store = open_doc_store(path)
+    assert store.docs_per_block == 3
+    assert [store.get(d_id) for d_id in range(7)] == docs
+
+def test_rejects_bad_files(tmp_path):
+    path = tmp_path / "store.bin"
+    write_store(path, [("a", "b")])
+    data = bytearray(path.read_bytes())
+
+    with pytest.raises(ValueError, match="truncated"):
+        DocStore(bytes(10))
+
+    data[-docstore.TRAILER.size:-docstore.TRAILER.size + 8] = b'NOTSTORE'
+    with pytest.raises(ValueError, match="bad magic"):
+        DocStore(bytes(data))
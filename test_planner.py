@@ -0,0 +1,82 @@
+import math
+import heapq
+import random
+import pytest
+import planner
+from bundle import IndexBundle, compile_bundle
+from conftest import DOC_COUNT, WORDS, write_index
+
+def brute_force(postings, d_lengths, tokens, k):
+    """
+    Scores every document with the full cosine formula
+    """
+    q_tf = {token: tokens.count(token) for token in tokens if token in postings}
+    q_weights = dict()
+    for token, query_freq in q_tf.items():
+        idf = math.log(DOC_COUNT / len(postings[token]), 10)
+        if idf > 0:
+            q_weights[token] = (1 + math.log(query_freq, 10)) * idf
+    if not q_weights:
+        return []
+    q_length = math.sqrt(sum(weight**2 for weight in q_weights.values()))
+
+    scores = dict()
+    for token, q_weight in q_weights.items():
+        for id, weight in postings[token].items():
+            if not d_lengths[id]:
+                continue # Every term of the document is in every document
+            scores[int(id)] = scores.get(int(id), 0.0) + q_weight * weight / d_lengths[id]
+    return heapq.nlargest(k, ((score / q_length, d_id) for d_id, score in scores.items()))
+
+def test_term_at_a_time_matches_brute_force(index):
+    bundle, postings, d_lengths = index
+    rng = random.Random(11)
+    for _ in range(200):
+        tokens = [rng.choice(WORDS) for _ in range(rng.randint(1, 6))] + ["missing"]
+        k = rng.choice([1, 3, 10, 20])
+
+        plan = planner.plan_query(bundle, tokens, k)
+        expected = brute_force(postings, d_lengths, tokens, k)
+        if not expected:
+            assert plan["mode"] is None
+            continue
+        assert plan["mode"] == planner.TAAT # Every query fits in the budget on a small index
+        results = planner.run_plan(bundle, plan)
+
+        # Documents can tie, so compare the scores and check every result is scored right
+        assert [score for score, _ in results] == pytest.approx([score for score, _ in expected])
+        full = dict((d_id, score) for score, d_id in brute_force(postings, d_lengths, tokens, DOC_COUNT))
+        for score, d_id in results:
+            assert score == pytest.approx(full[d_id])
+
+def test_champion_lists_over_budget(index, monkeypatch):
+    bundle = index[0]
+    monkeypatch.setattr(planner, "COST_BUDGET_MS", 0)
+    plan = planner.plan_query(bundle, ["a0", "b1", "c2"], 5)
+    assert plan["mode"] == planner.CHAMPION
+
+    # Only documents in the champion lists are ranked, best first
+    results = planner.run_plan(bundle, plan)
+    champions = {d_id for term in plan["terms"] for _, d_id in bundle.champions(term["id"])}
+    assert len(results) == 5
+    assert {d_id for _, d_id in results} <= champions
+    assert results == sorted(results, reverse=True)
+
+def test_threshold_rounding(tmp_path, monkeypatch):
+    # One document has the highest impact for every query term, so with k=1 the threshold ends up
+    # at its score, which is summed in a different order than the bounds and can round above them
+    for trial in range(40):
+        rng = random.Random(trial)
+        (tmp_path / str(trial)).mkdir()
+        monkeypatch.chdir(tmp_path / str(trial))
+        docs = [{term: rng.randint(1, 9) for term in ("a0", "b0", "c0")}]
+        for i in range(rng.randint(3, 40)):
+            doc = {f"z{i}x{j}": 1 for j in range(20)} # Filler terms only this document has
+            doc[("a0", "b0", "c0")[i % 3]] = 1
+            docs.append(doc)
+        write_index(docs)
+        compile_bundle()
+
+        bundle = IndexBundle()
+        plan = planner.plan_query(bundle, ["a0", "b0", "c0"], 1)
+        assert [d_id for _, d_id in planner.run_plan(bundle, plan)] == [0]
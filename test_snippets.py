@@ -0,0 +1,52 @@
+import random
+from snippets import make_snippet, stem_word, WORD_PATTERN, SNIPPET_LENGTH, SNIPPET_LEAD
+
+def highlighted(snippet):
+    """
+    Returns the stems of the words wrapped in <b> tags
+    """
+    return {stem_word(word.lower()) for word in WORD_PATTERN.findall(' '.join(
+        part.split("</b>")[0] for part in snippet.split("<b>")[1:]))}
+
+def best_window_terms(text, query_terms):
+    """
+    Most distinct query terms any window can hold, checking every window start
+    """
+    matches = [(match.start(), match.end(), stem_word(match.group().lower())) for match in WORD_PATTERN.finditer(text)]
+    matches = [match for match in matches if match[2] in query_terms]
+    best = 0
+    for start, _, _ in matches:
+        limit = start + SNIPPET_LENGTH - SNIPPET_LEAD
+        best = max(best, len({term for s, end, term in matches if s >= start and end <= limit}))
+    return best
+
+def test_highlights_and_escapes():
+    snippet = make_snippet("Tom & Jerry <script> are running </script> fast", {"run"})
+    assert snippet == "Tom &amp; Jerry &lt;script&gt; are <b>running</b> &lt;/script&gt; fast"
+
+def test_irregular_stems_are_highlighted():
+    # PorterStemmer maps "lying" to "lie", which doesn't start with the same two letters
+    assert stem_word("lying") == "lie"
+    assert "<b>lying</b>" in make_snippet("the dog was lying down", {"lie"})
+
+def test_no_match_shows_start_of_text():
+    text = ' '.join(["word"] * 200)
+    snippet = make_snippet(text, {"missing"})
+    assert snippet.startswith("word word")
+    assert snippet.endswith(" ...")
+    assert "<b>" not in snippet
+
+def test_picks_window_with_most_terms():
+    filler = ' '.join(["filler"] * 100)
+    text = f"apple {filler} apple banana cherry {filler}"
+    snippet = make_snippet(text, {"appl", "banana", "cherri"})
+    assert snippet.startswith("... ")
+    assert highlighted(snippet) == {"appl", "banana", "cherri"}
+
+def test_window_matches_brute_force():
+    rng = random.Random(5)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    for _ in range(300):
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 300)))
+        query_terms = {stem_word(word) for word in rng.sample(words, rng.randint(1, 4))}
+        assert len(highlighted(make_snippet(text, query_terms))) == best_window_terms(text, query_terms)